@@ -1,17 +1,370 @@
 #!/usr/bin/env python3
 
 import os
+import stat
 import subprocess
 import sys
 import re
+import json
+import random
+import time
+import threading
+import contextlib
+import contextvars
 import argparse
-from rich.console import Console
-from rich.table import Table
+import socket
+
+# rich and concurrent.futures are imported where they are used, so that
+# forwarding a command to the daemon does not pay for them.
+
+
+def default_socket_path():
+    # Per-user location, so other local users cannot bind the path first.
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "smartphone_cli.sock")
+    return f"/tmp/smartphone_cli-{os.getuid()}.sock"
+
+
+DEFAULT_SOCKET = os.environ.get("SMARTPHONE_CLI_SOCKET") or default_socket_path()
+# Seconds to wait for the daemon to accept a connection before running locally,
+# and by default for its reply before giving up.
+DAEMON_CONNECT_TIMEOUT = 2
+DAEMON_REPLY_TIMEOUT = 600
+
+class DeviceUnavailableError(subprocess.SubprocessError):
+
+    def __init__(self, device, retry_in):
+        self.device = device
+        self.retry_in = retry_in
+        super().__init__(f"Device {device} is unavailable (circuit open, retry in {retry_in:.0f}s).")
+
+
+class AdbExecutor:
+
+    DEFAULT_TIMEOUT = 15
+    RETRIES = 2
+    BACKOFF = 0.5
+    MAX_BACKOFF = 4
+    # Consecutive transient failures after which a device is skipped for COOLDOWN seconds.
+    FAILURE_THRESHOLD = 3
+    COOLDOWN = 30
+    # Seconds after a reboot during which connection errors are expected and
+    # do not count towards the circuit breaker.
+    REBOOT_WINDOW = 180
+    # adb errors caused by the connection rather than by the command itself.
+    TRANSIENT_ERRORS = re.compile(
+        r"device offline|device '.*' not found|no devices/emulators found|device still authorizing"
+        r"|error: closed|protocol fault|connection reset|cannot connect to daemon"
+    )
+
+    def __init__(self, log=None, timeout=DEFAULT_TIMEOUT, retries=RETRIES):
+        self.log = log or (lambda message: None)
+        self.timeout = timeout
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._offline_until = {}
+
+    def run(self, device, command, timeout=None, retries=None):
+        args = ["adb"] + (["-s", device] if device else []) + command
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            trial = self._check_breaker(device)
+            try:
+                output = subprocess.check_output(
+                    args, encoding="utf-8", errors="replace", stderr=subprocess.PIPE, timeout=timeout
+                )
+            except subprocess.TimeoutExpired:
+                # A hung call already used its whole deadline, retrying would only double it.
+                self._record_failure(device)
+                self.log(f"'{' '.join(args)}' timed out after {timeout}s.")
+                raise
+            except subprocess.CalledProcessError as e:
+                if not self.is_transient(e):
+                    self._record_success(device)
+                    raise
+                self._record_failure(device)
+                if attempt == retries:
+                    raise
+                delay = random.uniform(0, min(self.MAX_BACKOFF, self.BACKOFF * 2 ** attempt))
+                self.log(f"'{' '.join(args)}' failed ({(e.stderr or '').strip()}), retrying in {delay:.2f}s...")
+                time.sleep(delay)
+            except OSError as e:
+                raise subprocess.SubprocessError(f"Cannot run adb: {e}") from e
+            else:
+                self._record_success(device)
+                return output
+            finally:
+                # Whatever ended the trial call, including errors recorded
+                # neither as success nor failure, the next caller may probe.
+                if trial:
+                    self._release_trial(device)
+
+    def stream(self, device, command, output, timeout=None, chunk_size=64 * 1024):
+        # Copies the raw stdout of an adb exec-out command into a file object in
+        # fixed-size chunks, so memory use does not grow with the output size.
+        # The process is killed once the deadline passes.
+        trial = self._check_breaker(device)
+        try:
+            return self._stream(device, command, output, timeout, chunk_size)
+        finally:
+            if trial:
+                self._release_trial(device)
+
+    def _stream(self, device, command, output, timeout, chunk_size):
+        import tempfile
+        # stderr goes to a temporary file rather than a pipe, so it cannot fill
+        # up and block the process while stdout is being read.
+        errors = tempfile.TemporaryFile()
+        try:
+            process = subprocess.Popen(
+                ["adb", "-s", device, "exec-out"] + command,
+                stdout=subprocess.PIPE,
+                stderr=errors
+            )
+        except OSError as e:
+            errors.close()
+            raise subprocess.SubprocessError(f"Cannot run adb: {e}") from e
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            process.kill()
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer is not None:
+            timer.start()
+        copied = 0
+        try:
+            while True:
+                chunk = process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                output.write(chunk)
+                copied += len(chunk)
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+            if timer is not None:
+                timer.cancel()
+            errors.seek(0)
+            stderr = errors.read().decode("utf-8", "replace")
+            errors.close()
+        if timed_out.is_set():
+            self._record_failure(device)
+            self.log(f"'adb -s {device} exec-out {' '.join(command)}' timed out after {timeout}s.")
+            raise subprocess.TimeoutExpired(command, timeout)
+        if returncode != 0:
+            error = subprocess.CalledProcessError(returncode, command, stderr=stderr)
+            # As in run(), only connection errors count against the device; a
+            # failing command (e.g. a missing file) means the device answered.
+            if self.is_transient(error):
+                self._record_failure(device)
+            else:
+                self._record_success(device)
+            raise error
+        self._record_success(device)
+        return copied
+
+    def is_transient(self, error):
+        message = f"{error.stderr or ''} {error.output or ''}".lower()
+        return self.TRANSIENT_ERRORS.search(message) is not None
+
+    def expect_offline(self, device, seconds=REBOOT_WINDOW):
+        # Called after a reboot: the device disappears from adb while it boots,
+        # which must not open its circuit and delay noticing it is back.
+        with self._lock:
+            self._breakers.pop(device, None)
+            self._offline_until[device] = time.monotonic() + seconds
+
+    def is_available(self, device):
+        with self._lock:
+            return self._retry_in(self._breakers.get(device)) is None
+
+    def _retry_in(self, breaker):
+        # Seconds until the device may be tried again, None if it can be tried now.
+        if breaker is None or breaker["opened_at"] is None:
+            return None
+        retry_in = breaker["opened_at"] + self.COOLDOWN - time.monotonic()
+        if retry_in > 0:
+            return retry_in
+        return 0 if breaker["trial"] else None
+
+    def _check_breaker(self, device):
+        # Returns True when this call is the half-open trial for the device.
+        if not device:
+            return False
+        with self._lock:
+            breaker = self._breakers.get(device)
+            retry_in = self._retry_in(breaker)
+            if retry_in is not None:
+                raise DeviceUnavailableError(device, retry_in)
+            if breaker is not None and breaker["opened_at"] is not None:
+                # Cooldown over: this call is the single trial, concurrent
+                # callers keep failing fast until it succeeds or fails.
+                breaker["trial"] = True
+                return True
+        return False
+
+    def _record_failure(self, device):
+        if not device:
+            return
+        with self._lock:
+            if time.monotonic() < self._offline_until.get(device, 0):
+                return
+            breaker = self._breakers.setdefault(device, {"failures": 0, "opened_at": None, "trial": False})
+            breaker["failures"] += 1
+            opened = breaker["trial"] or (breaker["failures"] >= self.FAILURE_THRESHOLD and breaker["opened_at"] is None)
+            if opened:
+                breaker["opened_at"] = time.monotonic()
+                breaker["trial"] = False
+        if opened:
+            self.log(f"Device {device} is not responding, skipping it for {self.COOLDOWN}s.")
+
+    def _record_success(self, device):
+        if not device:
+            return
+        with self._lock:
+            self._breakers.pop(device, None)
+
+    def _release_trial(self, device):
+        with self._lock:
+            breaker = self._breakers.get(device)
+            if breaker is not None:
+                breaker["trial"] = False
+
+
+class ResultCache:
+
+    # Seconds each read-only query stays valid. Device properties only change
+    # with a firmware update, radio state changes quickly.
+    DEFAULT_TTLS = {
+        "device_info": 3600,
+        "airplane_mode": 5,
+        "connectivity": 2,
+    }
+
+    def __init__(self, ttls=None, cache_dir=None, enabled=True):
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self._entries = {}
+        # Bumped by invalidate(), so a fetch that started before a mutation
+        # does not store its now stale result afterwards.
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    _bypassed = contextvars.ContextVar("result_cache_bypassed", default=False)
+
+    def fetch(self, query, device, fetch):
+        ttl = self.ttls.get(query, 0)
+        if not self.enabled or ttl <= 0 or self._bypassed.get():
+            return fetch()
+        key = (query, device)
+        # One fetch per key at a time: concurrent callers wait for the first one
+        # and reuse its result instead of all querying the phone.
+        with self._key_lock(key):
+            value = self._get(key)
+            if value is not None:
+                return value
+            with self._lock:
+                generation = self._generations.get(key, 0)
+            if self.cache_dir:
+                return self._fetch_shared(key, ttl, fetch, generation)
+            value = fetch()
+            self._set(key, value, ttl, generation)
+            return value
+
+    @contextlib.contextmanager
+    def bypass(self):
+        # Queries made in this context (and threads started with a copy of it)
+        # go to the device and leave the cache untouched.
+        token = self._bypassed.set(True)
+        try:
+            yield
+        finally:
+            self._bypassed.reset(token)
+
+    def invalidate(self, device, *queries):
+        queries = queries or tuple(self.ttls)
+        with self._lock:
+            for query in queries:
+                self._entries.pop((query, device), None)
+                self._generations[(query, device)] = self._generations.get((query, device), 0) + 1
+        if self.cache_dir:
+            import fcntl
+            for query in queries:
+                path = self._path((query, device))
+                # Taking the fetch lock waits for a read already in flight in
+                # another process, so its result is removed rather than kept.
+                with open(path + ".lock", "w") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        return None
+
+    def _set(self, key, value, ttl, generation):
+        if value is None:
+            return None
+        expires = time.time() + ttl
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return None
+            self._entries[key] = (expires, value)
+        return expires
+
+    def _path(self, key):
+        query, device = key
+        return os.path.join(self.cache_dir, re.sub(r"[^\w.-]", "_", f"{device}.{query}") + ".json")
+
+    def _fetch_shared(self, key, ttl, fetch, generation):
+        import fcntl
+        path = self._path(key)
+        # The lock file serializes fetches across CLI processes sharing cache_dir.
+        with open(path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                if entry["expires"] > time.time():
+                    with self._lock:
+                        self._entries[key] = (entry["expires"], entry["value"])
+                    return entry["value"]
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+            value = fetch()
+            expires = self._set(key, value, ttl, generation)
+            if expires is not None:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"expires": expires, "value": value}, f)
+                os.replace(tmp_path, path)
+            return value
 
 class DeviceManager:
 
-    def __init__(self, logfile_path="/tmp/smartphone_cli.log"):
+    def __init__(self, logfile_path="/tmp/smartphone_cli.log", cache=None, adb=None):
         self.logfile_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), logfile_path)
+        self.cache = cache if cache is not None else ResultCache()
+        self._log_lock = threading.Lock()
+        self.adb = adb if adb is not None else AdbExecutor(log=self.log)
+        self.interactive = True
         self.devices = self.get_connected_devices()
 
     def log(self, message):
@@ -22,11 +375,14 @@ class DeviceManager:
         func_name = caller.function
         class_name = self.__class__.__name__
         log_line = f"[{timestamp}] [{class_name}.{func_name}] {message}"
-        with open(self.logfile_path, "a") as f:
-            f.write(log_line + "\n")
-        print(log_line)
+        with self._log_lock:
+            with open(self.logfile_path, "a") as f:
+                f.write(log_line + "\n")
+            print(log_line)
 
     def list_devices(self):
+        from rich.console import Console
+        from rich.table import Table
         console = Console()
         self.log("Listing all connected devices:")
         table = Table(title="Connected Devices")
@@ -44,33 +400,38 @@ class DeviceManager:
 
     def get_connected_devices(self):
         try:
-            output = subprocess.check_output(["adb", "devices"], encoding="utf-8")
+            output = self.adb.run(None, ["devices"])
             lines = output.strip().splitlines()[1:]
             devices = [line.split()[0] for line in lines if "\tdevice" in line]
             if not devices:
                 self.log("No device connected via ADB.")
                 # sys.exit(1)
             return devices
-        except subprocess.CalledProcessError:
+        except subprocess.SubprocessError:
             self.log("Error running 'adb devices'.")
-            # sys.exit(1)
+            return []
 
     def get_device_info(self, device):
         def get_prop(prop):
-            try:
-                return subprocess.check_output([
-                    "adb", "-s", device, "shell", "getprop", prop
-                ], encoding="utf-8").strip()
-            except Exception:
-                return "Unknown"
-        return {
-            "brand": get_prop("ro.product.brand"),
-            "device": get_prop("ro.product.device"),
-            "name": get_prop("ro.product.name"),
-            "model": get_prop("ro.product.model")
-        }
+            return self.adb.run(device, ["shell", "getprop", prop]).strip()
+
+        def query():
+            return {
+                "brand": get_prop("ro.product.brand"),
+                "device": get_prop("ro.product.device"),
+                "name": get_prop("ro.product.name"),
+                "model": get_prop("ro.product.model")
+            }
+        try:
+            return self.cache.fetch("device_info", device, query)
+        except subprocess.SubprocessError as e:
+            # Not cached, so the next call asks the device again.
+            self.log(f"Error reading properties of {device}: {e}")
+            return {"brand": "Unknown", "device": "Unknown", "name": "Unknown", "model": "Unknown"}
 
     def select_device(self, device_id=None):
+        from rich.console import Console
+        from rich.table import Table
         console = Console()
         if device_id and device_id in self.devices:
             info = self.get_device_info(device_id)
@@ -83,6 +444,9 @@ class DeviceManager:
             info = self.get_device_info(self.devices[0])
             self.log(f"One device found: {self.devices[0]} | Brand: {info['brand']} | Device: {info['device']} | Name: {info['name']} | Model: {info['model']}")
             return self.devices[0]
+        elif not self.interactive:
+            self.log("Multiple devices found, pass --id to select one.")
+            sys.exit(1)
         else:
             self.log("Multiple devices found:")
             table = Table(title="Connected Devices")
@@ -112,31 +476,34 @@ class DeviceManager:
 
     def get_airplane_mode_status(self, device):
         try:
-            output = subprocess.check_output(
-                ["adb", "-s", device, "shell", "cmd", "connectivity", "airplane-mode"],
-                encoding="utf-8"
-            ).strip()
+            output = self.cache.fetch("airplane_mode", device, lambda: self.adb.run(
+                device, ["shell", "cmd", "connectivity", "airplane-mode"]
+            ).strip())
             self.log(f"Current airplane mode: {output}")
             return output
-        except subprocess.CalledProcessError as e:
+        except subprocess.SubprocessError as e:
             self.log("Error getting airplane mode status.")
             self.log(f"Message: {e}")
-            sys.exit(1)
+            return None
 
     def set_airplane_mode(self, device, enable: bool):
         state = "enable" if enable else "disable"
+        # Invalidated again once the command is done, in case a read cached the
+        # old state while it was running.
+        self.cache.invalidate(device, "airplane_mode", "connectivity")
         try:
-            subprocess.run(
-                ["adb", "-s", device, "shell", "cmd", "connectivity", "airplane-mode", state],
-                check=True
-            )
+            self.adb.run(device, ["shell", "cmd", "connectivity", "airplane-mode", state])
             self.log(f"Airplane mode {'enabled' if enable else 'disabled'}.")
-        except subprocess.CalledProcessError as e:
+            return True
+        except subprocess.SubprocessError as e:
             self.log(f"Error setting airplane mode to '{state}'.")
             self.log(f"Message: {e}")
+            return False
+        finally:
+            self.cache.invalidate(device, "airplane_mode", "connectivity")
 
     def auto_toggle_airplane_mode(self, device):
-        status = self.get_airplane_mode_status(device)
+        status = self.get_airplane_mode_status(device) or ""
         if "enabled" in status:
             self.log("Airplane mode already enabled. Disabling...")
             self.set_airplane_mode(device, False)
@@ -148,14 +515,35 @@ class DeviceManager:
 
     def reboot_device(self, device):
         self.log("Starting device reboot...")
+        self.cache.invalidate(device)
         try:
-            subprocess.run(["adb", "-s", device, "reboot"], check=True)
+            self.adb.run(device, ["reboot"], timeout=30)
+            self.adb.expect_offline(device)
             self.log("Device rebooted successfully.")
-        except subprocess.CalledProcessError as e:
+            return True
+        except subprocess.SubprocessError as e:
             self.log("Error rebooting device.")
             self.log(f"Message: {e}")
+            return False
+        finally:
+            self.cache.invalidate(device)
+
+    def stream_output(self, device, command, output, timeout=600, chunk_size=64 * 1024):
+        return self.adb.stream(device, command, output, timeout=timeout, chunk_size=chunk_size)
+
+    def start_bugreport(self, device):
+        self.log("Generating bugreport...")
+        output = self.adb.run(device, ["shell", "bugreportz"], timeout=300, retries=0).strip()
+        # bugreportz prints "OK:<path>" on success and "FAIL:<reason>" otherwise.
+        if not output.startswith("OK:"):
+            raise subprocess.CalledProcessError(1, ["bugreportz"], output)
+        path = output[3:].strip()
+        self.log(f"Bugreport ready: {path}")
+        return path
 
     def check_device_status(self, device=None):
+        from rich.console import Console
+        from rich.table import Table
         console = Console()
         if device is not None:
             info = self.get_device_info(device)
@@ -185,10 +573,10 @@ class DeviceManager:
             }
             for idx, dev in enumerate(self.devices):
                 info = self.get_device_info(dev)
-                # Airplane mode
-                airplane = self.get_airplane_mode_status(dev)
+                # Airplane mode (unreachable devices are reported, not fatal)
+                airplane = self.get_airplane_mode_status(dev) or "Unknown"
                 # Connectivity
-                connectivity = self.monitor_connectivity_type(dev)
+                connectivity = self.monitor_connectivity_type(dev) or "Unknown"
                 print(connectivity)
                 if airplane == "enabled":
                     table.add_row(
@@ -211,24 +599,556 @@ class DeviceManager:
             "EDGE": "2G (EDGE)",
             "GPRS": "2G (GPRS)"
         }
-        try:
-            output = subprocess.check_output(
-                ["adb", "-s", device, "shell", "dumpsys", "telephony.registry"],
-                encoding="utf-8",
-                stderr=subprocess.DEVNULL
-            )
+
+        def query():
+            output = self.adb.run(device, ["shell", "dumpsys", "telephony.registry"])
             matches = re.findall(r"accessNetworkTechnology=([A-Z_]+)", output)
-            if matches:
-                latest = matches[-1].strip().upper()
+            return matches[-1].strip().upper() if matches else None
+        try:
+            latest = self.cache.fetch("connectivity", device, query)
+            if latest:
                 result = string_type_map.get(latest, "Unknown")
                 self.log(f"Current connectivity: {result}")
                 return result
             else:
                 self.log("Field 'accessNetworkTechnology' not found.")
-        except subprocess.CalledProcessError as e:
+        except subprocess.SubprocessError as e:
             self.log(f"Error running adb: {e}")
 
-def main():
+def load_scenario(path):
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("PyYAML is required for YAML scenarios (pip install pyyaml), or use a JSON step file.")
+        scenario = yaml.safe_load(content)
+    else:
+        scenario = json.loads(content)
+    if not isinstance(scenario, dict) or not isinstance(scenario.get("steps"), list):
+        raise ValueError(f"Scenario {path} must define a 'steps' list.")
+    for idx, step in enumerate(scenario["steps"]):
+        if not isinstance(step, dict) or step.get("action") not in ScenarioRunner.ACTIONS:
+            raise ValueError(f"Step {idx} has an unknown action: {step}")
+    return scenario
+
+
+class ScenarioRunner:
+
+    ACTIONS = ("airplane_mode", "reboot", "wait", "wait_connectivity", "record", "barrier")
+
+    def __init__(self, manager, scenario, devices=None):
+        self.manager = manager
+        self.steps = scenario["steps"]
+        self.default_timeout = scenario.get("timeout", 60)
+        self.default_retries = scenario.get("retries", 0)
+        # Step threads that outlived their timeout, by device.
+        self._abandoned = {}
+        if devices is None:
+            devices = scenario.get("devices", "all")
+        if devices == "all":
+            devices = list(manager.devices)
+        self.devices = [dev for dev in devices if dev in manager.devices]
+        for dev in devices:
+            if dev not in manager.devices:
+                manager.log(f"Device {dev} not found among connected devices, skipping.")
+        # One barrier per barrier step, so a barrier that breaks on a timeout
+        # does not break the ones after it.
+        self.barriers = {
+            idx: threading.Barrier(len(self.devices))
+            for idx, step in enumerate(self.steps) if step["action"] == "barrier" and self.devices
+        }
+
+    def run(self):
+        if not self.devices:
+            self.manager.log("No devices to run the scenario on.")
+            return []
+        self.manager.log(f"Running {len(self.steps)} steps on {len(self.devices)} devices...")
+        start = time.monotonic()
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(self.devices)) as pool:
+            # Each worker runs in a copy of the caller's context, so per-request
+            # state such as the daemon's output capture follows it.
+            futures = [pool.submit(contextvars.copy_context().run, self.run_device, dev) for dev in self.devices]
+            per_device = [future.result() for future in futures]
+        elapsed = time.monotonic() - start
+        self.manager.log(f"Scenario finished in {elapsed:.2f}s.")
+        results = [result for device_results in per_device for result in device_results]
+        self.print_report(results, elapsed)
+        return results
+
+    def run_device(self, device):
+        results = []
+        failed = False
+        for idx, step in enumerate(self.steps):
+            action = step["action"]
+            result = {"device": device, "step": idx, "action": action, "attempts": 0,
+                      "status": "skipped", "duration": 0.0, "value": None}
+            timeout = step.get("timeout", self.default_timeout)
+            if action == "wait":
+                # A wait is bounded by its own duration.
+                timeout = None
+            start = time.monotonic()
+            if action == "barrier":
+                # Barriers are always reached so that devices which failed earlier
+                # do not leave the others waiting. Every other step is bounded by
+                # its own timeout, so barriers only time out when asked to. A
+                # barrier that times out is reported, but devices carry on.
+                try:
+                    self.barriers[idx].wait(step.get("timeout"))
+                    result["status"] = "ok"
+                except threading.BrokenBarrierError:
+                    result["status"] = "timeout"
+            elif not failed:
+                retries = step.get("retries", self.default_retries)
+                for attempt in range(retries + 1):
+                    result["attempts"] = attempt + 1
+                    ok, value = self.run_step(device, step, timeout)
+                    result["value"] = value
+                    if ok:
+                        result["status"] = "ok"
+                        break
+                    result["status"] = "timeout" if value == "timeout" else "failed"
+                    if attempt < retries:
+                        self.manager.log(f"{device}: step {idx} ({action}) failed, retrying ({attempt + 1}/{retries})...")
+                failed = result["status"] != "ok"
+            result["duration"] = time.monotonic() - start
+            results.append(result)
+        return results
+
+    def run_step(self, device, step, timeout):
+        # Steps run in a daemon thread so a hung adb call cannot hold the device
+        # past its deadline; the call is abandoned rather than killed.
+        abandoned = self._abandoned.pop(device, None)
+        if abandoned is not None and abandoned.is_alive():
+            # Never two commands in flight on one device: a retry or a later
+            # step waits for the timed out call, which adb's deadline bounds.
+            self.manager.log(f"{device}: waiting for the timed out step to finish...")
+            abandoned.join()
+        outcome = {}
+
+        def target():
+            try:
+                outcome["result"] = self.execute(device, step, timeout)
+            except (Exception, SystemExit) as e:
+                outcome["error"] = e
+
+        worker = threading.Thread(target=contextvars.copy_context().run, args=(target,), daemon=True)
+        worker.start()
+        worker.join(timeout)
+        if worker.is_alive():
+            self.manager.log(f"{device}: step '{step['action']}' timed out after {timeout}s.")
+            self._abandoned[device] = worker
+            return False, "timeout"
+        if "error" in outcome:
+            self.manager.log(f"{device}: step '{step['action']}' raised {outcome['error']!r}.")
+            return False, None
+        return outcome["result"]
+
+    def execute(self, device, step, timeout):
+        action = step["action"]
+        if action == "airplane_mode":
+            enable = step.get("enable", True)
+            return self.manager.set_airplane_mode(device, enable), "enabled" if enable else "disabled"
+        if action == "reboot":
+            return self.manager.reboot_device(device), None
+        if action == "wait":
+            time.sleep(step.get("seconds", 0))
+            return True, None
+        if action == "wait_connectivity":
+            return self.wait_connectivity(device, step.get("expect"), timeout, step.get("interval", 2))
+        if action == "record":
+            what = step.get("what", "connectivity")
+            if what == "airplane_mode":
+                value = self.manager.get_airplane_mode_status(device)
+            else:
+                value = self.manager.monitor_connectivity_type(device)
+            return value is not None, value
+        return False, None
+
+    def wait_connectivity(self, device, expect, timeout, interval):
+        deadline = time.monotonic() + timeout
+        while True:
+            connectivity = self.manager.monitor_connectivity_type(device)
+            if connectivity and connectivity != "Unknown":
+                if expect is None or expect in connectivity:
+                    return True, connectivity
+            if time.monotonic() + interval > deadline:
+                return False, connectivity
+            time.sleep(interval)
+
+    def print_report(self, results, elapsed):
+        from rich.console import Console
+        from rich.table import Table
+        console = Console()
+        table = Table(title=f"Scenario Report ({elapsed:.2f}s)")
+        table.add_column("Serial", style="magenta")
+        table.add_column("Step", style="cyan", justify="right")
+        table.add_column("Action", style="yellow")
+        table.add_column("Status")
+        table.add_column("Attempts", justify="right")
+        table.add_column("Duration", justify="right")
+        table.add_column("Result", style="bright_cyan")
+        for result in results:
+            status = result["status"]
+            if status != "ok":
+                status = f"[red]{status}[/red]"
+            else:
+                status = f"[green]{status}[/green]"
+            table.add_row(
+                result["device"], str(result["step"]), result["action"], status, str(result["attempts"]),
+                f"{result['duration']:.2f}s", "" if result["value"] is None else str(result["value"])
+            )
+        console.print(table)
+
+class LogCollector:
+
+    # Command outputs are gzipped on the fly; device files are copied as-is
+    # (bugreports are already zip archives) so a partial copy can be resumed.
+    COMMANDS = {
+        "logcat": (["logcat", "-d"], "logcat.txt.gz"),
+        "dumpsys": (["dumpsys"], "dumpsys.txt.gz"),
+    }
+    ITEMS = tuple(COMMANDS) + ("bugreport",)
+
+    def __init__(self, manager, output_dir, items=("logcat", "dumpsys"), devices=None):
+        self.manager = manager
+        self.output_dir = output_dir
+        self.items = list(items)
+        for item in self.items:
+            if item not in self.ITEMS and not item.startswith("/"):
+                raise ValueError(f"Unknown item '{item}', expected one of {', '.join(self.ITEMS)} or a device path.")
+        if devices is None:
+            devices = list(manager.devices)
+        self.devices = [dev for dev in devices if dev in manager.devices]
+        for dev in devices:
+            if dev not in manager.devices:
+                manager.log(f"Device {dev} not found among connected devices, skipping.")
+
+    def run(self):
+        if not self.devices:
+            self.manager.log("No devices to collect from.")
+            return []
+        self.manager.log(f"Collecting {', '.join(self.items)} from {len(self.devices)} devices into {self.output_dir}...")
+        start = time.monotonic()
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(self.devices)) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, self.collect_device, dev) for dev in self.devices]
+            per_device = [future.result() for future in futures]
+        elapsed = time.monotonic() - start
+        results = [result for device_results in per_device for result in device_results]
+        self.manager.log(f"Collection finished in {elapsed:.2f}s.")
+        self.print_report(results, elapsed)
+        return results
+
+    def collect_device(self, device):
+        device_dir = os.path.join(self.output_dir, re.sub(r"[^\w.-]", "_", device))
+        os.makedirs(device_dir, exist_ok=True)
+        results = []
+        for item in self.items:
+            result = {"device": device, "item": item, "status": "ok", "bytes": 0, "duration": 0.0, "path": None}
+            start = time.monotonic()
+            try:
+                if item in self.COMMANDS:
+                    command, filename = self.COMMANDS[item]
+                    result["path"] = os.path.join(device_dir, filename)
+                    result["status"], result["bytes"] = self.collect_command(device, command, result["path"])
+                elif item == "bugreport":
+                    result["path"], result["status"], result["bytes"] = self.collect_bugreport(device, device_dir)
+                else:
+                    # Keep the device directory layout, so /a/log.txt and /b/log.txt do not collide.
+                    result["path"] = os.path.join(device_dir, os.path.normpath(item).lstrip("/"))
+                    result["status"], result["bytes"] = self.collect_file(device, item, result["path"])
+            except (OSError, subprocess.SubprocessError) as e:
+                self.manager.log(f"{device}: failed to collect {item}: {e}")
+                result["status"] = "failed"
+            result["duration"] = time.monotonic() - start
+            results.append(result)
+        return results
+
+    def collect_command(self, device, command, path):
+        import gzip
+        if os.path.exists(path):
+            return "exists", 0
+        # Command output cannot be resumed, a partial file is simply rewritten.
+        part_path = path + ".part"
+        # A moderate level keeps compression from becoming the bottleneck
+        # when many devices are collected at once.
+        with gzip.open(part_path, "wb", compresslevel=6) as output:
+            copied = self.manager.stream_output(device, command, output)
+        os.replace(part_path, path)
+        return "ok", copied
+
+    def collect_bugreport(self, device, device_dir):
+        import glob
+        done = glob.glob(os.path.join(glob.escape(device_dir), "bugreport*.zip"))
+        if done:
+            return done[0], "exists", 0
+        # The device path of a bugreport being copied is kept next to it, so a
+        # rerun resumes that copy instead of generating a new report.
+        remote_path = os.path.join(device_dir, "bugreport.remote")
+        if os.path.exists(remote_path):
+            with open(remote_path, "r", encoding="utf-8") as f:
+                remote = f.read().strip()
+        else:
+            remote = self.manager.start_bugreport(device)
+            with open(remote_path, "w", encoding="utf-8") as f:
+                f.write(remote)
+        path = os.path.join(device_dir, os.path.basename(remote))
+        try:
+            status, copied = self.collect_file(device, remote, path)
+        except subprocess.CalledProcessError as e:
+            if not self.manager.adb.is_transient(e):
+                # The report is gone from the device (rebooted, wiped): start
+                # over with a new one next time instead of failing forever.
+                os.remove(remote_path)
+                if os.path.exists(path + ".part"):
+                    os.remove(path + ".part")
+            raise
+        os.remove(remote_path)
+        return path, status, copied
+
+    def collect_file(self, device, remote, path):
+        if os.path.exists(path):
+            return "exists", 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = path + ".part"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset:
+            self.manager.log(f"{device}: resuming {remote} at byte {offset}.")
+        with open(part_path, "ab") as output:
+            copied = self.manager.stream_output(device, ["tail", "-c", f"+{offset + 1}", remote], output)
+        os.replace(part_path, path)
+        return "resumed" if offset else "ok", copied
+
+    def print_report(self, results, elapsed):
+        from rich.console import Console
+        from rich.table import Table
+        console = Console()
+        table = Table(title=f"Collection Report ({elapsed:.2f}s)")
+        table.add_column("Serial", style="magenta")
+        table.add_column("Item", style="yellow")
+        table.add_column("Status")
+        table.add_column("Size", justify="right")
+        table.add_column("Duration", justify="right")
+        table.add_column("Throughput", style="bright_cyan", justify="right")
+        for result in results:
+            status = result["status"]
+            status = f"[red]{status}[/red]" if status == "failed" else f"[green]{status}[/green]"
+            throughput = result["bytes"] / result["duration"] / 1e6 if result["duration"] else 0.0
+            table.add_row(
+                result["device"], result["item"], status, f"{result['bytes'] / 1e6:.2f} MB",
+                f"{result['duration']:.2f}s", f"{throughput:.2f} MB/s"
+            )
+        console.print(table)
+
+
+class _RequestOutput:
+    # Stands in for sys.stdout in the daemon: each request writes into its own
+    # buffer, so prints, logs and rich tables go back to the right client. The
+    # buffer is held in a context variable, so worker threads started with a
+    # copy of the request's context write into it too.
+
+    _capture = contextvars.ContextVar("request_output", default=None)
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def capture(self, buffer, isatty=False):
+        return self._capture.set((buffer, isatty))
+
+    def release(self, token):
+        self._capture.reset(token)
+
+    def write(self, data):
+        capture = self._capture.get()
+        return (capture[0] if capture is not None else self._stream).write(data)
+
+    def flush(self):
+        if self._capture.get() is None:
+            self._stream.flush()
+
+    def isatty(self):
+        capture = self._capture.get()
+        if capture is not None:
+            return capture[1]
+        return self._stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class DeviceDaemon:
+
+    # DeviceManager methods callable directly over the socket.
+    RPC_METHODS = (
+        "get_connected_devices", "get_device_info", "get_airplane_mode_status", "set_airplane_mode",
+        "auto_toggle_airplane_mode", "reboot_device", "monitor_connectivity_type",
+    )
+    DEVICES_TTL = 2
+
+    def __init__(self, manager, socket_path=DEFAULT_SOCKET):
+        self.manager = manager
+        self.manager.interactive = False
+        self.socket_path = socket_path
+        self._devices_fetched = time.monotonic()
+        self._devices_lock = threading.Lock()
+        self.server = None
+
+    def serve_forever(self):
+        import io
+        import socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        response = daemon.handle(request, io.StringIO())
+                    except ValueError as e:
+                        response = {"code": 1, "error": f"Invalid request: {e}"}
+                    self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+
+        if os.path.lexists(self.socket_path):
+            if not socket_owned(self.socket_path):
+                self.manager.log(f"{self.socket_path} exists and is not a socket owned by this user, not replacing it.")
+                sys.exit(1)
+            if daemon_running(self.socket_path):
+                self.manager.log(f"A daemon is already listening on {self.socket_path}.")
+                sys.exit(1)
+            os.remove(self.socket_path)
+        # The socket is created with owner-only permissions from the start.
+        umask = os.umask(0o077)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        finally:
+            os.umask(umask)
+        server.daemon_threads = True
+        sys.stdout = _RequestOutput(sys.stdout)
+        self.server = server
+        self.manager.log(f"Daemon listening on {self.socket_path} with {len(self.manager.devices)} devices.")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.server.server_close()
+            os.remove(self.socket_path)
+            sys.stdout = sys.stdout._stream
+            self.manager.log("Daemon stopped.")
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def refresh_devices(self, force=False):
+        with self._devices_lock:
+            if force or time.monotonic() - self._devices_fetched > self.DEVICES_TTL:
+                self.manager.devices = self.manager.get_connected_devices() or []
+                self._devices_fetched = time.monotonic()
+
+    def handle(self, request, buffer):
+        output = sys.stdout
+        token = None
+        if isinstance(output, _RequestOutput):
+            token = output.capture(buffer, bool(request.get("isatty")))
+        try:
+            if "method" in request:
+                return self.call(request["method"], request.get("args", []), buffer, request.get("no_cache", False))
+            return self.run_argv(request.get("argv", []), request.get("cwd"), buffer)
+        finally:
+            if token is not None:
+                output.release(token)
+
+    def call(self, method, args, buffer, no_cache=False):
+        if method not in self.RPC_METHODS:
+            return {"code": 1, "error": f"Unknown method: {method}"}
+        try:
+            with self.manager.cache.bypass() if no_cache else contextlib.nullcontext():
+                result = getattr(self.manager, method)(*args)
+        except SystemExit as e:
+            return {"code": e.code or 1, "output": buffer.getvalue()}
+        except Exception as e:
+            return {"code": 1, "error": repr(e), "output": buffer.getvalue()}
+        if method == "get_connected_devices":
+            with self._devices_lock:
+                self.manager.devices = result or []
+                self._devices_fetched = time.monotonic()
+        return {"code": 0, "result": result, "output": buffer.getvalue()}
+
+    def run_argv(self, argv, cwd, buffer):
+        parser = build_parser()
+        code = 0
+        try:
+            args = parser.parse_args(argv)
+            if cwd:
+                if args.scenario:
+                    args.scenario = os.path.join(cwd, args.scenario)
+                if args.collect:
+                    args.collect = os.path.join(cwd, args.collect)
+            self.refresh_devices()
+            # The daemon keeps its own cache; --no-cache skips it for this request.
+            with self.manager.cache.bypass() if args.no_cache else contextlib.nullcontext():
+                run_command(self.manager, parser, args)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            self.manager.log(f"Error running {argv}: {e!r}")
+            code = 1
+        return {"code": code, "output": buffer.getvalue()}
+
+
+def socket_owned(socket_path):
+    try:
+        info = os.lstat(socket_path)
+    except FileNotFoundError:
+        return False
+    return stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid()
+
+
+def daemon_running(socket_path=DEFAULT_SOCKET):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def daemon_request(request, socket_path=DEFAULT_SOCKET, timeout=DAEMON_REPLY_TIMEOUT):
+    # Returns None when no daemon is listening, so callers can run locally.
+    if not os.path.lexists(socket_path):
+        return None
+    if not socket_owned(socket_path):
+        print(f"Warning: {socket_path} is not a socket owned by this user, not using it.", file=sys.stderr)
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    # Once connected the command may already be running, so a daemon that does
+    # not answer is reported rather than retried locally.
+    sock.settimeout(timeout)
+    try:
+        with sock, sock.makefile("rwb") as stream:
+            stream.write((json.dumps(request) + "\n").encode("utf-8"))
+            stream.flush()
+            line = stream.readline()
+    except socket.timeout:
+        return {"code": 1, "error": f"Daemon did not reply within {timeout}s."}
+    if not line:
+        return {"code": 1, "error": "Daemon closed the connection."}
+    return json.loads(line)
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description="ADB Control: airplane mode, reboot, status or network type.")
     group = parser.add_mutually_exclusive_group()
     group.add_argument("-a", "--airplane", action="store_true", help="Enable/disable airplane mode")
@@ -236,13 +1156,26 @@ def main():
     group.add_argument("-s", "--status", action="store_true", help="Check airplane mode status")
     group.add_argument("-c", "--connectivity_type", action="store_true", help="Check current network type")
     group.add_argument("-l", "--list", action="store_true", help="List all connected devices with brand info")
+    group.add_argument("--scenario", type=str, metavar="FILE", help="Run a JSON/YAML step file on all (or --id) devices in parallel")
+    group.add_argument("--collect", type=str, metavar="DIR", help="Collect logs from all (or --id) devices in parallel into DIR")
+    group.add_argument("--daemon", action="store_true", help="Run as a resident daemon serving CLI calls on --socket")
     parser.add_argument("--id", type=str, help="Device serial (optional)")
+    parser.add_argument("--items", type=str, default="logcat,dumpsys",
+                        help="Comma-separated items for --collect: logcat, dumpsys, bugreport or device file paths")
+    parser.add_argument("--cache-dir", type=str, default=os.environ.get("SMARTPHONE_CLI_CACHE_DIR"),
+                        help="Share cached device queries with other processes through this directory")
+    parser.add_argument("--no-cache", action="store_true", help="Always query the device, never reuse results")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET, help="Daemon unix socket path")
+    parser.add_argument("--no-daemon", action="store_true", help="Run locally even if a daemon is running")
+    parser.add_argument("--daemon-timeout", type=float, default=DAEMON_REPLY_TIMEOUT,
+                        help="Seconds to wait for the daemon's reply")
+    return parser
 
-    args = parser.parse_args()
-    manager = DeviceManager()
 
+def run_command(manager, parser, args):
     # If no arguments are passed, list devices by default
-    if not any(vars(args).values()):
+    options = ("items", "cache_dir", "no_cache", "socket", "no_daemon", "daemon_timeout")
+    if not any(value for name, value in vars(args).items() if name not in options):
         if not manager.devices:
             print("No devices connected.")
             parser.print_help()
@@ -254,6 +1187,37 @@ def main():
         manager.list_devices()
         return
 
+    if args.scenario:
+        if not manager.devices:
+            print("No devices connected.")
+            parser.print_help()
+            return
+        try:
+            scenario = load_scenario(args.scenario)
+        except (OSError, ValueError, RuntimeError) as e:
+            manager.log(f"Error loading scenario: {e}")
+            sys.exit(1)
+        runner = ScenarioRunner(manager, scenario, devices=[args.id] if args.id else None)
+        results = runner.run()
+        if any(result["status"] not in ("ok", "skipped") for result in results):
+            sys.exit(1)
+        return
+
+    if args.collect:
+        if not manager.devices:
+            print("No devices connected.")
+            parser.print_help()
+            return
+        try:
+            collector = LogCollector(manager, args.collect, args.items.split(","), devices=[args.id] if args.id else None)
+        except ValueError as e:
+            manager.log(str(e))
+            sys.exit(1)
+        results = collector.run()
+        if any(result["status"] == "failed" for result in results):
+            sys.exit(1)
+        return
+
     # For status: if multiple devices, show all statuses in table, else select device
     if args.status:
         if not manager.devices:
@@ -276,5 +1240,31 @@ def main():
     elif args.connectivity_type:
         manager.monitor_connectivity_type(device_serial)
 
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if not args.daemon and not args.no_daemon:
+        response = daemon_request({"argv": argv, "cwd": os.getcwd(), "isatty": sys.stdout.isatty()},
+                                  args.socket, args.daemon_timeout)
+        if response is not None:
+            if any(arg == "--cache-dir" or arg.startswith("--cache-dir=") for arg in argv):
+                print("Warning: --cache-dir is ignored by the daemon, which keeps its own cache. "
+                      "Pass --no-daemon to use it.", file=sys.stderr)
+            sys.stdout.write(response.get("output", ""))
+            if response.get("error"):
+                print(response["error"], file=sys.stderr)
+            if response.get("code"):
+                sys.exit(response["code"])
+            return
+
+    manager = DeviceManager(cache=ResultCache(cache_dir=args.cache_dir, enabled=not args.no_cache))
+    if args.daemon:
+        DeviceDaemon(manager, args.socket).serve_forever()
+        return
+    run_command(manager, parser, args)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
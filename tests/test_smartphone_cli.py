@@ -1,7 +1,27 @@
+import gzip
+import io
+import os
+import socket
+import subprocess
+import threading
+import time
 import pytest
 from unittest.mock import patch, MagicMock
 
-from smartphone_cli import DeviceManager
+from smartphone_cli import (
+    AdbExecutor,
+    DeviceDaemon,
+    DeviceManager,
+    DeviceUnavailableError,
+    LogCollector,
+    ResultCache,
+    ScenarioRunner,
+    daemon_request,
+    default_socket_path,
+    load_scenario,
+    main,
+    _RequestOutput,
+)
 
 @pytest.fixture
 def mock_devices():
@@ -37,20 +57,20 @@ def test_get_airplane_mode_status(mock_check_output, device_manager):
     status = device_manager.get_airplane_mode_status("device1")
     assert status == "enabled"
 
-@patch("smartphone_cli.subprocess.run")
-def test_set_airplane_mode_enable(mock_run, device_manager):
-    device_manager.set_airplane_mode("device1", True)
-    mock_run.assert_called_with(
+@patch("smartphone_cli.subprocess.check_output")
+def test_set_airplane_mode_enable(mock_check_output, device_manager):
+    assert device_manager.set_airplane_mode("device1", True)
+    mock_check_output.assert_called_with(
         ["adb", "-s", "device1", "shell", "cmd", "connectivity", "airplane-mode", "enable"],
-        check=True
+        encoding="utf-8", errors="replace", stderr=-1, timeout=15
     )
 
-@patch("smartphone_cli.subprocess.run")
-def test_set_airplane_mode_disable(mock_run, device_manager):
-    device_manager.set_airplane_mode("device1", False)
-    mock_run.assert_called_with(
+@patch("smartphone_cli.subprocess.check_output")
+def test_set_airplane_mode_disable(mock_check_output, device_manager):
+    assert device_manager.set_airplane_mode("device1", False)
+    mock_check_output.assert_called_with(
         ["adb", "-s", "device1", "shell", "cmd", "connectivity", "airplane-mode", "disable"],
-        check=True
+        encoding="utf-8", errors="replace", stderr=-1, timeout=15
     )
 
 @patch("smartphone_cli.DeviceManager.get_airplane_mode_status")
@@ -67,10 +87,10 @@ def test_auto_toggle_airplane_mode_disable(mock_set, mock_status, device_manager
     device_manager.auto_toggle_airplane_mode("device1")
     mock_set.assert_called_with("device1", False)
 
-@patch("smartphone_cli.subprocess.run")
-def test_reboot_device(mock_run, device_manager):
-    device_manager.reboot_device("device1")
-    mock_run.assert_called_with(["adb", "-s", "device1", "reboot"], check=True)
+@patch("smartphone_cli.subprocess.check_output")
+def test_reboot_device(mock_check_output, device_manager):
+    assert device_manager.reboot_device("device1")
+    mock_check_output.assert_called_with(["adb", "-s", "device1", "reboot"], encoding="utf-8", errors="replace", stderr=-1, timeout=30)
 
 @patch("smartphone_cli.DeviceManager.get_device_info")
 @patch("smartphone_cli.DeviceManager.get_airplane_mode_status")
@@ -92,4 +112,607 @@ def test_monitor_connectivity_type_found(mock_check_output, device_manager):
 def test_monitor_connectivity_type_not_found(mock_check_output, device_manager):
     mock_check_output.return_value = "no relevant info"
     device_manager.monitor_connectivity_type("device1")
-    # Should log "Field 'accessNetworkTechnology' not found."
\ No newline at end of file
+    # Should log "Field 'accessNetworkTechnology' not found."
+
+
+def test_load_scenario_json(tmp_path):
+    path = tmp_path / "scenario.json"
+    path.write_text('{"steps": [{"action": "airplane_mode", "enable": true}, {"action": "wait", "seconds": 0}]}')
+    scenario = load_scenario(str(path))
+    assert [step["action"] for step in scenario["steps"]] == ["airplane_mode", "wait"]
+
+
+def test_load_scenario_rejects_unknown_action(tmp_path):
+    path = tmp_path / "scenario.json"
+    path.write_text('{"steps": [{"action": "explode"}]}')
+    with pytest.raises(ValueError):
+        load_scenario(str(path))
+
+
+@patch("smartphone_cli.DeviceManager.monitor_connectivity_type", return_value="4G (LTE)")
+@patch("smartphone_cli.DeviceManager.set_airplane_mode", return_value=True)
+def test_scenario_runs_all_devices(mock_set, mock_monitor, device_manager):
+    scenario = {"steps": [
+        {"action": "airplane_mode", "enable": True},
+        {"action": "barrier"},
+        {"action": "airplane_mode", "enable": False},
+        {"action": "wait_connectivity", "expect": "LTE", "timeout": 5},
+        {"action": "record"},
+    ]}
+    results = ScenarioRunner(device_manager, scenario).run()
+    assert len(results) == 10
+    assert all(result["status"] == "ok" for result in results)
+    assert mock_set.call_count == 4
+    assert {r["value"] for r in results if r["action"] == "record"} == {"4G (LTE)"}
+
+
+@patch("smartphone_cli.DeviceManager.reboot_device")
+@patch("smartphone_cli.DeviceManager.set_airplane_mode", return_value=True)
+def test_scenario_retries_then_skips(mock_set, mock_reboot, device_manager):
+    mock_reboot.side_effect = lambda device: device == "device2"
+    scenario = {"devices": ["device1", "device2"], "steps": [
+        {"action": "reboot", "retries": 2},
+        {"action": "barrier", "timeout": 5},
+        {"action": "airplane_mode", "enable": True},
+    ]}
+    results = ScenarioRunner(device_manager, scenario).run()
+    by_device = {(r["device"], r["step"]): r for r in results}
+    assert by_device[("device1", 0)]["status"] == "failed"
+    assert by_device[("device1", 0)]["attempts"] == 3
+    assert by_device[("device1", 1)]["status"] == "ok"
+    assert by_device[("device1", 2)]["status"] == "skipped"
+    assert by_device[("device2", 2)]["status"] == "ok"
+    mock_set.assert_called_once_with("device2", True)
+
+
+def test_scenario_step_timeout(device_manager):
+    hang = threading.Event()
+    with patch("smartphone_cli.DeviceManager.reboot_device", side_effect=lambda device: hang.wait(5)):
+        results = ScenarioRunner(device_manager, {"devices": ["device1"], "steps": [{"action": "reboot", "timeout": 0.1}]}).run()
+    hang.set()
+    assert results[0]["status"] == "timeout"
+
+
+def test_scenario_retry_waits_for_timed_out_attempt(device_manager):
+    in_flight = []
+    overlaps = []
+
+    def reboot(device):
+        overlaps.append(len(in_flight))
+        in_flight.append(device)
+        time.sleep(0.2 if len(overlaps) == 1 else 0)
+        in_flight.pop()
+        return True
+    scenario = {"devices": ["device1"], "steps": [{"action": "reboot", "timeout": 0.05, "retries": 1}]}
+    with patch("smartphone_cli.DeviceManager.reboot_device", side_effect=reboot):
+        results = ScenarioRunner(device_manager, scenario).run()
+    assert overlaps == [0, 0]
+    assert results[0]["status"] == "ok"
+    assert results[0]["attempts"] == 2
+
+
+def test_scenario_wait_longer_than_step_timeout(device_manager):
+    scenario = {"devices": ["device1"], "timeout": 0.05, "steps": [{"action": "wait", "seconds": 0.2}]}
+    results = ScenarioRunner(device_manager, scenario).run()
+    assert results[0]["status"] == "ok"
+
+
+@patch("smartphone_cli.DeviceManager.set_airplane_mode", return_value=True)
+def test_scenario_barrier_timeout_does_not_abort_run(mock_set, device_manager):
+    def reboot(device):
+        if device == "device1":
+            time.sleep(0.5)
+        return True
+    scenario = {"steps": [
+        {"action": "reboot", "timeout": 5},
+        {"action": "barrier", "timeout": 0.3},
+        {"action": "airplane_mode", "enable": True},
+        {"action": "barrier"},
+        {"action": "airplane_mode", "enable": False},
+    ]}
+    with patch("smartphone_cli.DeviceManager.reboot_device", side_effect=reboot):
+        results = ScenarioRunner(device_manager, scenario).run()
+    by_step = {(r["device"], r["step"]): r["status"] for r in results}
+    assert by_step[("device2", 1)] == "timeout"
+    for device in ("device1", "device2"):
+        assert [by_step[(device, step)] for step in (2, 3, 4)] == ["ok", "ok", "ok"]
+    assert mock_set.call_count == 4
+
+
+@patch("smartphone_cli.DeviceManager.set_airplane_mode", return_value=True)
+def test_scenario_barrier_waits_for_slow_step_by_default(mock_set, device_manager):
+    def reboot(device):
+        if device == "device1":
+            time.sleep(0.3)
+        return True
+    scenario = {"timeout": 0.1, "steps": [
+        {"action": "reboot", "timeout": 5},
+        {"action": "barrier"},
+        {"action": "airplane_mode", "enable": True},
+    ]}
+    with patch("smartphone_cli.DeviceManager.reboot_device", side_effect=reboot):
+        results = ScenarioRunner(device_manager, scenario).run()
+    assert all(r["status"] == "ok" for r in results)
+
+
+@patch("smartphone_cli.subprocess.check_output")
+def test_get_device_info_is_cached(mock_check_output, device_manager):
+    mock_check_output.return_value = "test_value"
+    device_manager.get_device_info("device1")
+    device_manager.get_device_info("device1")
+    assert mock_check_output.call_count == 4
+
+
+@patch("smartphone_cli.subprocess.check_output")
+def test_set_airplane_mode_invalidates_status(mock_check_output, device_manager):
+    mock_check_output.return_value = "disabled"
+    assert device_manager.get_airplane_mode_status("device1") == "disabled"
+    mock_check_output.return_value = "enabled"
+    assert device_manager.get_airplane_mode_status("device1") == "disabled"
+    device_manager.set_airplane_mode("device1", True)
+    assert device_manager.get_airplane_mode_status("device1") == "enabled"
+
+
+def test_read_during_set_airplane_mode_is_not_cached(device_manager):
+    state = {"airplane": "disabled"}
+    toggling = threading.Event()
+    read_done = threading.Event()
+
+    def adb(args, **kwargs):
+        if args[-1] == "enable":
+            toggling.set()
+            read_done.wait(5)
+            state["airplane"] = "enabled"
+        return state["airplane"]
+    with patch("smartphone_cli.subprocess.check_output", side_effect=adb):
+        toggle = threading.Thread(target=device_manager.set_airplane_mode, args=("device1", True))
+        toggle.start()
+        toggling.wait(5)
+        assert device_manager.get_airplane_mode_status("device1") == "disabled"
+        read_done.set()
+        toggle.join(5)
+        assert device_manager.get_airplane_mode_status("device1") == "enabled"
+
+
+def test_result_cache_drops_fetch_overtaken_by_invalidate():
+    cache = ResultCache()
+    started = threading.Event()
+    invalidated = threading.Event()
+
+    def slow_fetch():
+        started.set()
+        invalidated.wait(5)
+        return "disabled"
+    reader = threading.Thread(target=cache.fetch, args=("airplane_mode", "device1", slow_fetch))
+    reader.start()
+    started.wait(5)
+    cache.invalidate("device1", "airplane_mode")
+    invalidated.set()
+    reader.join(5)
+    assert cache.fetch("airplane_mode", "device1", lambda: "enabled") == "enabled"
+
+
+def test_result_cache_expires():
+    cache = ResultCache(ttls={"airplane_mode": 10})
+    fetch = MagicMock(side_effect=["disabled", "enabled"])
+    with patch("smartphone_cli.time.time", return_value=100):
+        assert cache.fetch("airplane_mode", "device1", fetch) == "disabled"
+        assert cache.fetch("airplane_mode", "device1", fetch) == "disabled"
+    with patch("smartphone_cli.time.time", return_value=111):
+        assert cache.fetch("airplane_mode", "device1", fetch) == "enabled"
+
+
+def test_result_cache_does_not_store_none():
+    cache = ResultCache()
+    fetch = MagicMock(side_effect=[None, "LTE"])
+    assert cache.fetch("connectivity", "device1", fetch) is None
+    assert cache.fetch("connectivity", "device1", fetch) == "LTE"
+
+
+def test_result_cache_disabled():
+    cache = ResultCache(enabled=False)
+    fetch = MagicMock(return_value="enabled")
+    cache.fetch("airplane_mode", "device1", fetch)
+    cache.fetch("airplane_mode", "device1", fetch)
+    assert fetch.call_count == 2
+
+
+def test_result_cache_shared_dir(tmp_path):
+    first = ResultCache(cache_dir=str(tmp_path))
+    second = ResultCache(cache_dir=str(tmp_path))
+    info = {"brand": "b", "device": "d", "name": "n", "model": "m"}
+    assert first.fetch("device_info", "10.0.0.2:5555", lambda: info) == info
+    fetch = MagicMock()
+    assert second.fetch("device_info", "10.0.0.2:5555", fetch) == info
+    fetch.assert_not_called()
+    second.invalidate("10.0.0.2:5555")
+    fetch.return_value = info
+    ResultCache(cache_dir=str(tmp_path)).fetch("device_info", "10.0.0.2:5555", fetch)
+    fetch.assert_called_once()
+
+
+def test_shared_cache_invalidate_waits_for_read_in_flight(tmp_path):
+    reader = ResultCache(cache_dir=str(tmp_path))
+    writer = ResultCache(cache_dir=str(tmp_path))
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_fetch():
+        started.set()
+        release.wait(5)
+        return "disabled"
+    read = threading.Thread(target=reader.fetch, args=("airplane_mode", "device1", slow_fetch))
+    read.start()
+    started.wait(5)
+    invalidate = threading.Thread(target=writer.invalidate, args=("device1", "airplane_mode"))
+    invalidate.start()
+    time.sleep(0.1)
+    release.set()
+    read.join(5)
+    invalidate.join(5)
+    assert ResultCache(cache_dir=str(tmp_path)).fetch("airplane_mode", "device1", lambda: "enabled") == "enabled"
+
+
+def test_shared_cache_ignores_malformed_entry(tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    with open(cache._path(("airplane_mode", "device1")), "w") as f:
+        f.write("[1, 2]")
+    assert cache.fetch("airplane_mode", "device1", lambda: "enabled") == "enabled"
+
+
+def test_daemon_request_without_daemon(tmp_path):
+    assert daemon_request({"argv": []}, str(tmp_path / "missing.sock")) is None
+
+
+def test_daemon_request_ignores_socket_of_other_user(tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+        with patch("smartphone_cli.os.getuid", return_value=os.getuid() + 1):
+            assert daemon_request({"argv": []}, socket_path) is None
+
+
+def test_daemon_request_times_out_on_wedged_daemon(tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+        response = daemon_request({"argv": []}, socket_path, timeout=0.1)
+    assert response["code"] == 1
+    assert "did not reply" in response["error"]
+
+
+def test_default_socket_path_is_per_user():
+    with patch.dict("os.environ", {"XDG_RUNTIME_DIR": "/run/user/1000"}):
+        assert default_socket_path() == "/run/user/1000/smartphone_cli.sock"
+    with patch.dict("os.environ", {}, clear=True):
+        assert default_socket_path() == f"/tmp/smartphone_cli-{os.getuid()}.sock"
+
+
+@patch("smartphone_cli.DeviceManager.get_airplane_mode_status", return_value="enabled")
+def test_daemon_rpc_call(mock_status, device_manager):
+    daemon = DeviceDaemon(device_manager, socket_path="unused")
+    assert daemon.handle({"method": "get_airplane_mode_status", "args": ["device1"]}, io.StringIO())["result"] == "enabled"
+    assert daemon.handle({"method": "__init__"}, io.StringIO())["code"] == 1
+
+
+@patch("smartphone_cli.DeviceManager.set_airplane_mode")
+def test_daemon_requires_id_with_multiple_devices(mock_set, device_manager):
+    daemon = DeviceDaemon(device_manager, socket_path="unused")
+    assert daemon.handle({"argv": ["-a"]}, io.StringIO())["code"] == 1
+    mock_set.assert_not_called()
+
+
+@patch("smartphone_cli.subprocess.check_output", return_value="accessNetworkTechnology=LTE")
+def test_daemon_honours_no_cache(mock_check_output, device_manager):
+    daemon = DeviceDaemon(device_manager, socket_path="unused")
+    daemon.refresh_devices = MagicMock()
+
+    def dumpsys_calls():
+        return sum("dumpsys" in call.args[0] for call in mock_check_output.call_args_list)
+    for _ in range(2):
+        assert daemon.handle({"argv": ["-c", "--id", "device1", "--no-cache"]}, io.StringIO())["code"] == 0
+    assert dumpsys_calls() == 2
+    for _ in range(2):
+        daemon.handle({"method": "monitor_connectivity_type", "args": ["device1"], "no_cache": True}, io.StringIO())
+    assert dumpsys_calls() == 4
+    for _ in range(2):
+        daemon.handle({"method": "monitor_connectivity_type", "args": ["device1"]}, io.StringIO())
+    assert dumpsys_calls() == 5
+
+
+@patch("smartphone_cli.time.sleep")
+@patch("smartphone_cli.DeviceManager.reboot_device", return_value=False)
+def test_daemon_returns_scenario_worker_logs(mock_reboot, mock_sleep, device_manager, tmp_path):
+    path = tmp_path / "scenario.json"
+    path.write_text('{"steps": [{"action": "reboot", "retries": 1}]}')
+    daemon = DeviceDaemon(device_manager, socket_path="unused")
+    daemon.refresh_devices = MagicMock()
+    with patch("sys.stdout", _RequestOutput(io.StringIO())) as stdout:
+        response = daemon.handle({"argv": ["--scenario", str(path)]}, io.StringIO())
+    assert "device1: step 0 (reboot) failed, retrying" in response["output"]
+    assert "device2: step 0 (reboot) failed, retrying" in response["output"]
+    assert stdout._stream.getvalue() == ""
+
+
+@patch("smartphone_cli.DeviceManager.get_airplane_mode_status", return_value="disabled")
+@patch("smartphone_cli.DeviceManager.set_airplane_mode", return_value=True)
+def test_daemon_forwards_cli_commands(mock_set, mock_status, device_manager, tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    daemon = DeviceDaemon(device_manager, socket_path=socket_path)
+    daemon.refresh_devices = MagicMock()
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if daemon.server is not None:
+            break
+        time.sleep(0.01)
+    try:
+        assert os.stat(socket_path).st_mode & 0o077 == 0
+        main(["-a", "--id", "device2", "--socket", socket_path])
+    finally:
+        daemon.shutdown()
+        thread.join(5)
+    mock_set.assert_called_once_with("device2", True)
+
+
+@patch("smartphone_cli.subprocess.Popen")
+def test_stream_output_copies_in_chunks(mock_popen, device_manager):
+    mock_popen.return_value.stdout = io.BytesIO(b"x" * 10)
+    mock_popen.return_value.wait.return_value = 0
+    output = io.BytesIO()
+    assert device_manager.stream_output("device1", ["logcat", "-d"], output, chunk_size=4) == 10
+    assert output.getvalue() == b"x" * 10
+    assert mock_popen.call_args.args[0] == ["adb", "-s", "device1", "exec-out", "logcat", "-d"]
+    assert mock_popen.call_args.kwargs["stdout"] == subprocess.PIPE
+
+
+@patch("smartphone_cli.subprocess.check_output", return_value="OK:/bugreports/report.zip\n")
+def test_start_bugreport(mock_check_output, device_manager):
+    assert device_manager.start_bugreport("device1") == "/bugreports/report.zip"
+
+
+def test_collector_writes_compressed_files(device_manager, tmp_path):
+
+    def fake_stream(device, command, output):
+        output.write(f"{device} {command[0]}".encode())
+        return 10
+    with patch("smartphone_cli.DeviceManager.stream_output", side_effect=fake_stream):
+        results = LogCollector(device_manager, str(tmp_path)).run()
+    assert {r["status"] for r in results} == {"ok"}
+    with gzip.open(tmp_path / "device2" / "logcat.txt.gz") as f:
+        assert f.read() == b"device2 logcat"
+    assert not list(tmp_path.glob("*/*.part"))
+
+
+def test_collector_resumes_partial_file(device_manager, tmp_path):
+    (tmp_path / "device1" / "sdcard").mkdir(parents=True)
+    (tmp_path / "device1" / "sdcard" / "trace.bin.part").write_bytes(b"abc")
+    stream = MagicMock(side_effect=lambda device, command, output: output.write(b"def"))
+    with patch("smartphone_cli.DeviceManager.stream_output", stream):
+        results = LogCollector(device_manager, str(tmp_path), items=["/sdcard/trace.bin"], devices=["device1"]).run()
+    assert results[0]["status"] == "resumed"
+    stream.assert_called_once()
+    assert stream.call_args[0][1] == ["tail", "-c", "+4", "/sdcard/trace.bin"]
+    assert (tmp_path / "device1" / "sdcard" / "trace.bin").read_bytes() == b"abcdef"
+
+
+def test_collector_keeps_device_paths_apart(device_manager, tmp_path):
+    stream = MagicMock(side_effect=lambda device, command, output: output.write(command[-1].encode()))
+    with patch("smartphone_cli.DeviceManager.stream_output", stream):
+        results = LogCollector(device_manager, str(tmp_path), items=["/a/log.txt", "/b/log.txt"],
+                               devices=["device1"]).run()
+    assert [r["status"] for r in results] == ["ok", "ok"]
+    assert (tmp_path / "device1" / "a" / "log.txt").read_bytes() == b"/a/log.txt"
+    assert (tmp_path / "device1" / "b" / "log.txt").read_bytes() == b"/b/log.txt"
+
+
+@patch("smartphone_cli.DeviceManager.start_bugreport", return_value="/bugreports/bugreport-1.zip")
+def test_collector_does_not_regenerate_bugreport(mock_start, device_manager, tmp_path):
+    stream = MagicMock(side_effect=OSError("interrupted"))
+    collector = LogCollector(device_manager, str(tmp_path), items=["bugreport"], devices=["device1"])
+    with patch("smartphone_cli.DeviceManager.stream_output", stream):
+        assert collector.run()[0]["status"] == "failed"
+    stream.side_effect = lambda device, command, output: output.write(b"zip")
+    with patch("smartphone_cli.DeviceManager.stream_output", stream):
+        assert collector.run()[0]["status"] == "ok"
+        assert collector.run()[0]["status"] == "exists"
+    mock_start.assert_called_once_with("device1")
+    assert (tmp_path / "device1" / "bugreport-1.zip").read_bytes() == b"zip"
+    assert not (tmp_path / "device1" / "bugreport.remote").exists()
+
+
+@patch("smartphone_cli.DeviceManager.start_bugreport", side_effect=["/bugreports/old.zip", "/bugreports/new.zip"])
+def test_collector_restarts_bugreport_gone_from_device(mock_start, device_manager, tmp_path):
+    def stream(device, command, output):
+        if command[-1] == "/bugreports/old.zip":
+            output.write(b"partial")
+            raise subprocess.CalledProcessError(1, command, stderr="tail: /bugreports/old.zip: No such file")
+        return output.write(b"zip")
+    collector = LogCollector(device_manager, str(tmp_path), items=["bugreport"], devices=["device1"])
+    with patch("smartphone_cli.DeviceManager.stream_output", side_effect=stream):
+        assert collector.run()[0]["status"] == "failed"
+        assert not (tmp_path / "device1" / "bugreport.remote").exists()
+        assert not (tmp_path / "device1" / "old.zip.part").exists()
+        assert collector.run()[0]["status"] == "ok"
+    assert (tmp_path / "device1" / "new.zip").read_bytes() == b"zip"
+
+
+def test_collector_rejects_unknown_item(device_manager, tmp_path):
+    with pytest.raises(ValueError):
+        LogCollector(device_manager, str(tmp_path), items=["screenshots"])
+
+
+def adb_error(stderr):
+    return subprocess.CalledProcessError(1, ["adb"], output="", stderr=stderr)
+
+
+@patch("smartphone_cli.time.sleep")
+@patch("smartphone_cli.subprocess.check_output")
+def test_executor_retries_transient_errors(mock_check_output, mock_sleep):
+    mock_check_output.side_effect = [adb_error("error: device offline"), "ok"]
+    assert AdbExecutor().run("device1", ["shell", "true"]) == "ok"
+    assert mock_check_output.call_count == 2
+    mock_sleep.assert_called_once()
+
+
+@patch("smartphone_cli.time.sleep")
+@patch("smartphone_cli.subprocess.check_output")
+def test_executor_does_not_retry_command_errors(mock_check_output, mock_sleep):
+    mock_check_output.side_effect = adb_error("Unknown command")
+    with pytest.raises(subprocess.CalledProcessError):
+        AdbExecutor().run("device1", ["shell", "cmd", "bogus"])
+    assert mock_check_output.call_count == 1
+
+
+@patch("smartphone_cli.subprocess.check_output")
+def test_executor_timeout_is_not_retried(mock_check_output):
+    mock_check_output.side_effect = subprocess.TimeoutExpired(["adb"], 1)
+    with pytest.raises(subprocess.TimeoutExpired):
+        AdbExecutor().run("device1", ["shell", "true"], timeout=1)
+    assert mock_check_output.call_count == 1
+
+
+@patch("smartphone_cli.time.sleep")
+@patch("smartphone_cli.subprocess.check_output")
+def test_executor_circuit_breaker(mock_check_output, mock_sleep):
+    mock_check_output.side_effect = adb_error("error: device 'device1' not found")
+    executor = AdbExecutor(retries=5)
+    with pytest.raises(DeviceUnavailableError):
+        executor.run("device1", ["shell", "true"])
+    assert mock_check_output.call_count == AdbExecutor.FAILURE_THRESHOLD
+    assert not executor.is_available("device1")
+    assert executor.is_available("device2")
+    with pytest.raises(DeviceUnavailableError):
+        executor.run("device1", ["shell", "true"])
+    assert mock_check_output.call_count == AdbExecutor.FAILURE_THRESHOLD
+    # After the cooldown a single trial call goes through and closes the circuit.
+    mock_check_output.side_effect = None
+    mock_check_output.return_value = "ok"
+    with patch("smartphone_cli.time.monotonic", return_value=time_after_cooldown()):
+        assert executor.run("device1", ["shell", "true"]) == "ok"
+    assert executor.is_available("device1")
+
+
+def time_after_cooldown():
+    return time.monotonic() + AdbExecutor.COOLDOWN + 1
+
+
+@patch("smartphone_cli.subprocess.check_output")
+def test_get_airplane_mode_status_error_returns_none(mock_check_output, device_manager):
+    mock_check_output.side_effect = adb_error("cmd: Failure calling service connectivity")
+    assert device_manager.get_airplane_mode_status("device1") is None
+
+
+@patch("smartphone_cli.subprocess.check_output", side_effect=FileNotFoundError("adb"))
+def test_get_device_info_without_adb(mock_check_output, device_manager):
+    assert device_manager.get_device_info("device1")["brand"] == "Unknown"
+    device_manager.get_device_info("device1")
+    assert mock_check_output.call_count == 2
+
+
+@patch("smartphone_cli.subprocess.Popen")
+def test_stream_output_timeout_kills_process(mock_popen, device_manager):
+    killed = threading.Event()
+
+    class Stdout:
+        def read(self, size):
+            killed.wait(5)
+            return b""
+
+        def close(self):
+            pass
+    mock_popen.return_value.stdout = Stdout()
+    mock_popen.return_value.kill.side_effect = killed.set
+    mock_popen.return_value.wait.return_value = -9
+    with pytest.raises(subprocess.TimeoutExpired):
+        device_manager.stream_output("device1", ["logcat"], MagicMock(), timeout=0.05)
+
+
+def fake_popen(returncode, stderr):
+    def popen(args, **kwargs):
+        kwargs["stderr"].write(stderr)
+        process = MagicMock()
+        process.stdout = io.BytesIO(b"")
+        process.wait.return_value = returncode
+        return process
+    return popen
+
+
+def test_stream_command_errors_do_not_open_circuit():
+    executor = AdbExecutor()
+    with patch("smartphone_cli.subprocess.Popen", side_effect=fake_popen(1, b"tail: /sdcard/x: No such file")):
+        for _ in range(AdbExecutor.FAILURE_THRESHOLD + 1):
+            with pytest.raises(subprocess.CalledProcessError) as error:
+                executor.stream("device1", ["tail", "-c", "+1", "/sdcard/x"], io.BytesIO())
+    assert "No such file" in error.value.stderr
+    assert executor.is_available("device1")
+
+
+def test_stream_connection_errors_open_circuit():
+    executor = AdbExecutor()
+    with patch("smartphone_cli.subprocess.Popen", side_effect=fake_popen(1, b"error: device offline")):
+        for _ in range(AdbExecutor.FAILURE_THRESHOLD):
+            with pytest.raises(subprocess.CalledProcessError):
+                executor.stream("device1", ["logcat", "-d"], io.BytesIO())
+    assert not executor.is_available("device1")
+
+
+def test_executor_half_open_lets_one_trial_through():
+    executor = AdbExecutor()
+    for _ in range(AdbExecutor.FAILURE_THRESHOLD):
+        executor._record_failure("device1")
+    with patch("smartphone_cli.time.monotonic", return_value=time_after_cooldown()):
+        assert executor.is_available("device1")
+        executor._check_breaker("device1")
+        assert not executor.is_available("device1")
+        with pytest.raises(DeviceUnavailableError):
+            executor._check_breaker("device1")
+        executor._record_failure("device1")
+    with pytest.raises(DeviceUnavailableError):
+        executor._check_breaker("device1")
+    with patch("smartphone_cli.time.monotonic", return_value=time_after_cooldown() + AdbExecutor.COOLDOWN):
+        executor._check_breaker("device1")
+        executor._record_success("device1")
+        executor._check_breaker("device1")
+        executor._check_breaker("device1")
+
+
+@patch("smartphone_cli.time.sleep")
+def test_reboot_does_not_open_circuit(mock_sleep, device_manager):
+    with patch("smartphone_cli.subprocess.check_output", return_value=""):
+        assert device_manager.reboot_device("device1")
+    with patch("smartphone_cli.subprocess.check_output", side_effect=adb_error("adb: device 'device1' not found")):
+        for _ in range(AdbExecutor.FAILURE_THRESHOLD + 1):
+            assert device_manager.monitor_connectivity_type("device1") is None
+    assert device_manager.adb.is_available("device1")
+
+
+def open_circuit_after_cooldown(executor, device):
+    for _ in range(AdbExecutor.FAILURE_THRESHOLD):
+        executor._record_failure(device)
+    return patch("smartphone_cli.time.monotonic", return_value=time_after_cooldown())
+
+
+def test_trial_released_after_unexpected_error():
+    executor = AdbExecutor()
+    with open_circuit_after_cooldown(executor, "device1"):
+        with patch("smartphone_cli.subprocess.check_output", side_effect=KeyboardInterrupt):
+            with pytest.raises(KeyboardInterrupt):
+                executor.run("device1", ["shell", "true"])
+        assert executor.is_available("device1")
+
+
+def test_stream_trial_released_when_output_fails():
+    executor = AdbExecutor()
+    output = MagicMock()
+    output.write.side_effect = OSError("No space left on device")
+    popen = MagicMock()
+    popen.return_value.stdout = io.BytesIO(b"data")
+    popen.return_value.wait.return_value = 0
+    with open_circuit_after_cooldown(executor, "device1"):
+        with patch("smartphone_cli.subprocess.Popen", popen):
+            with pytest.raises(OSError):
+                executor.stream("device1", ["logcat", "-d"], output)
+        assert executor.is_available("device1")